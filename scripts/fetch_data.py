@@ -1,24 +1,64 @@
 import pandas as pd
-from pybaseball import statcast_pitcher, statcast_batter, playerid_lookup
+from pybaseball import playerid_lookup
+import aiohttp
+import asyncio
+import requests_cache
+from aiohttp_client_cache import CachedSession, SQLiteBackend
+import codecs
+import io
 import os
+import random
 import sys
 import logging
+from datetime import datetime, timedelta
 
 
 # --- Configuration ---
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 OUTPUT_DIR = os.path.join(SCRIPT_DIR, '..', 'data', 'raw')
+# HTTP responses are cached here so re-runs over the same date range skip the network
+CACHE_DIR = os.path.join(SCRIPT_DIR, '..', '.cache')
+CACHE_EXPIRE_SECONDS = 24 * 3600
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Cache pybaseball's lookups (it uses requests under the hood); the Statcast
+# downloads go through aiohttp and are cached separately in get_roster_statcast_data
+os.makedirs(CACHE_DIR, exist_ok=True)
+requests_cache.install_cache(os.path.join(CACHE_DIR, 'pybaseball'), backend='sqlite', expire_after=CACHE_EXPIRE_SECONDS)
+
 # --- User Input with Defaults ---
 PLAYER_FIRST_NAME = os.getenv('PLAYER_FIRST_NAME', 'Shohei')
 PLAYER_LAST_NAME = os.getenv('PLAYER_LAST_NAME', 'Ohtani')
+# Comma-separated "First Last" names to fetch together, e.g. "Shohei Ohtani, Aaron Judge"
+PLAYERS = os.getenv('PLAYERS', f"{PLAYER_FIRST_NAME} {PLAYER_LAST_NAME}")
 PLAYER_TYPE = os.getenv('PLAYER_TYPE', 'batter').lower()
 START_DATE = os.getenv('START_DATE', '2023-01-01')
 END_DATE = os.getenv('END_DATE', '2023-12-31')
-OUTPUT_FILENAME = f"{PLAYER_FIRST_NAME.lower()}_{PLAYER_LAST_NAME.lower()}_{PLAYER_TYPE}_statcast_{START_DATE}_to_{END_DATE}.csv"
+# Split each player's query into windows of this many days to avoid timeouts
+# (the same split pybaseball uses)
+REQUEST_WINDOW_DAYS = 2190
+# Concurrent requests allowed against Baseball Savant, and retries on 429/5xx
+MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', '8'))
+MAX_RETRIES = 5
+
+# "First Last" -> (first, last); anything after the first name is the last name
+ROSTER = [name.strip().partition(' ')[::2] for name in PLAYERS.split(',') if name.strip()]
+if len(ROSTER) == 1:
+    OUTPUT_FILENAME = f"{ROSTER[0][0].lower()}_{ROSTER[0][1].lower()}_{PLAYER_TYPE}_statcast_{START_DATE}_to_{END_DATE}.parquet"
+else:
+    OUTPUT_FILENAME = f"roster_{PLAYER_TYPE}_statcast_{START_DATE}_to_{END_DATE}.parquet"
+
+# Baseball Savant's Statcast search CSV export, as queried by pybaseball's
+# statcast_batter/statcast_pitcher (player_type is 'batter' or 'pitcher')
+STATCAST_CSV_URL = (
+    'https://baseballsavant.mlb.com/statcast_search/csv?all=true&hfPT=&hfAB=&hfBBT=&hfPR=&hfZ=&stadium=&hfBBL='
+    '&hfNewZones=&hfGT=R%7CPO%7CS%7C=&hfSea=&hfSit=&player_type={player_type}&hfOuts=&opponent=&pitcher_throws='
+    '&batter_stands=&hfSA=&game_date_gt={start_dt}&game_date_lt={end_dt}&{player_type}s_lookup%5B%5D={player_id}'
+    '&team=&position=&hfRO=&home_road=&hfFlag=&metric_1=&hfInn=&min_pitches=0&min_results=0&group_by=name'
+    '&sort_col=pitches&player_event_sort=h_launch_speed&sort_order=desc&min_abs=0&type=details&'
+)
 
 COLUMNS_TO_KEEP = [
     'pitch_type', 'game_date', 'release_speed', 'release_pos_x', 'release_pos_z',
@@ -56,42 +96,125 @@ def find_player_id(last_name, first_name):
         logging.error(f"An unexpected error occurred during player ID lookup: {e}")
         return None
 
-def get_statcast_data(player_id, start_dt, end_dt, player_type):
-    """Fetches Statcast data using the appropriate pybaseball function."""
+def split_date_range(start_dt, end_dt, window_days):
+    """Splits an inclusive YYYY-MM-DD date range into consecutive (start, end) windows."""
+    current = datetime.strptime(start_dt, '%Y-%m-%d')
+    end = datetime.strptime(end_dt, '%Y-%m-%d')
+    windows = []
+    while current <= end:
+        window_end = min(current + timedelta(days=window_days), end)
+        windows.append((current.strftime('%Y-%m-%d'), window_end.strftime('%Y-%m-%d')))
+        current = window_end + timedelta(days=1)
+    return windows
+
+async def fetch_statcast_window(session, semaphore, player_id, start_dt, end_dt, player_type):
+    """Downloads one date window of Statcast data, retrying with exponential backoff on 429/5xx responses."""
+    url = STATCAST_CSV_URL.format(player_type=player_type, player_id=player_id, start_dt=start_dt, end_dt=end_dt)
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            # The request's timeout starts once it holds a slot, so waiting
+            # behind other requests doesn't count against it
+            async with semaphore, session.get(url) as response:
+                if response.status != 429 and response.status < 500:
+                    response.raise_for_status()
+                    body = await response.read()
+                    break
+                # Rate limited or server error: honour Retry-After if Savant sends one
+                retry_after = response.headers.get('Retry-After', '')
+                reason = f"HTTP {response.status}"
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            retry_after, reason = '', repr(e)
+        if attempt == MAX_RETRIES:
+            raise RuntimeError(f"giving up after {MAX_RETRIES} retries ({reason})")
+        delay = float(retry_after) if retry_after.isdigit() else 2 ** attempt + random.random()
+        logging.warning(f"{reason} for player {player_id} ({start_dt} to {end_dt}), retrying in {delay:.1f}s...")
+        await asyncio.sleep(delay)
+    body = body.removeprefix(codecs.BOM_UTF8) # Savant sometimes prefixes a byte order mark
+    if not body.strip():
+        return pd.DataFrame()
+    # pyarrow's reader parses the raw bytes in large blocks on all cores and
+    # infers one type per column over the whole response; the frame stays
+    # Arrow-backed all the way to the parquet file
+    return pd.read_csv(io.BytesIO(body), engine='pyarrow', dtype_backend='pyarrow')
+
+async def get_statcast_data(session, semaphore, player_id, start_dt, end_dt, player_type):
+    """Fetches a player's Statcast data from Baseball Savant, all date windows concurrently."""
     logging.info(f"Fetching Statcast data for player {player_id} ({player_type}) from {start_dt} to {end_dt}...")
     try:
-        if player_type == 'pitcher':
-            data = statcast_pitcher(start_dt=start_dt, end_dt=end_dt, player_id=player_id)
-        else:
-            data = statcast_batter(start_dt=start_dt, end_dt=end_dt, player_id=player_id)
-        if data is None or data.empty:
+        windows = split_date_range(start_dt, end_dt, REQUEST_WINDOW_DAYS)
+        # Every window runs to the end even if one fails, so none is left
+        # running against the session after it closes
+        frames = await asyncio.gather(*[
+            fetch_statcast_window(session, semaphore, player_id, window_start, window_end, player_type)
+            for window_start, window_end in windows
+        ], return_exceptions=True)
+        errors = [frame for frame in frames if isinstance(frame, Exception)]
+        if errors:
+            raise errors[0]
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
             logging.warning(f"No Statcast data found for player {player_id} in the specified date range.")
             return None
-        logging.info(f"Fetched {len(data)} rows of Statcast data.")
+        data = pd.concat(frames, ignore_index=True)
+        logging.info(f"Fetched {len(data)} rows of Statcast data for player {player_id}.")
         return data
     except Exception as e:
-        logging.error(f"An error occurred fetching Statcast data: {e}")
+        logging.error(f"An error occurred fetching Statcast data for player {player_id}: {e}")
         return None
 
+async def get_roster_statcast_data(player_ids, start_dt, end_dt, player_type):
+    """Fetches Statcast data for several players concurrently, returning one DataFrame (or None) per player."""
+    # One connection pool shared by every request, and at most
+    # MAX_CONCURRENT_REQUESTS of them in flight so we stay polite to Baseball
+    # Savant while the downloads overlap
+    connector = aiohttp.TCPConnector(limit_per_host=MAX_CONCURRENT_REQUESTS)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    timeout = aiohttp.ClientTimeout(total=600) # Large Statcast queries can be slow
+    # Successful responses are cached by URL, so repeating a query within a day is a SQLite read
+    cache = SQLiteBackend(cache_name=os.path.join(CACHE_DIR, 'statcast'), expire_after=CACHE_EXPIRE_SECONDS)
+    async with CachedSession(cache=cache, connector=connector, timeout=timeout) as session:
+        return await asyncio.gather(*[
+            get_statcast_data(session, semaphore, player_id, start_dt, end_dt, player_type) for player_id in player_ids
+        ])
+
+def unify_mixed_columns(df):
+    """Stores columns that came back as different types from different requests as text, which parquet can hold."""
+    # e.g. a column parsed as numbers for one player and as text for another
+    # ends up as a mixed object column after concatenation
+    mixed = df.columns[df.dtypes == object]
+    if len(mixed) == 0:
+        return df
+    logging.warning(f"Columns with mixed types across requests will be saved as text: {list(mixed)}")
+    return df.assign(**{col: df[col].astype(str).where(df[col].notna()) for col in mixed})
+
 def clean_and_select_columns(df, columns_to_keep):
     """Selects relevant columns and handles potential missing columns."""
     logging.info("Selecting relevant columns...")
-    existing_columns = [col for col in columns_to_keep if col in df.columns]
-    missing_columns = [col for col in columns_to_keep if col not in df.columns]
+    available = set(df.columns) # One hash probe per lookup instead of searching the Index
+    existing_columns = [col for col in columns_to_keep if col in available]
+    missing_columns = [col for col in columns_to_keep if col not in available]
     if missing_columns:
         logging.warning(f"The following requested columns were not found in the data: {missing_columns}")
     return df[existing_columns]
 
 if __name__ == "__main__":
-    # Find player id
-    mlbam_id = find_player_id(PLAYER_LAST_NAME, PLAYER_FIRST_NAME)
-    if mlbam_id is None: # exit if player not found
+    player_type = 'pitcher' if PLAYER_TYPE == 'pitcher' else 'batter'
+
+    # Find player ids, skipping players that can't be found
+    player_ids = []
+    for first_name, last_name in ROSTER:
+        mlbam_id = find_player_id(last_name, first_name)
+        if mlbam_id is not None:
+            player_ids.append(mlbam_id)
+    if not player_ids: # exit if no player was found
         sys.exit(1)
 
-    # Fetch Statcast data
-    statcast_df = get_statcast_data(mlbam_id, START_DATE, END_DATE, PLAYER_TYPE)
-    if statcast_df is not None:
-        cleaned_df = clean_and_select_columns(statcast_df, COLUMNS_TO_KEEP)
+    # Fetch Statcast data for every player in one concurrent wave
+    results = asyncio.run(get_roster_statcast_data(player_ids, START_DATE, END_DATE, player_type))
+    frames = [data for data in results if data is not None]
+    if frames:
+        statcast_df = pd.concat(frames, ignore_index=True)
+        cleaned_df = unify_mixed_columns(clean_and_select_columns(statcast_df, COLUMNS_TO_KEEP))
         try:
             os.makedirs(OUTPUT_DIR, exist_ok=True) # Create output directory if it doesn't exist
             logging.info(f"Ensured output directory exists: {OUTPUT_DIR}")
@@ -100,10 +223,11 @@ if __name__ == "__main__":
             sys.exit(1)
         output_path = os.path.join(OUTPUT_DIR, OUTPUT_FILENAME)
         try:
-            cleaned_df.to_csv(output_path, index=False)
+            # Parquet keeps the column types for the load step and is far smaller than CSV
+            cleaned_df.to_parquet(output_path, engine='pyarrow', compression='zstd', index=False)
             logging.info(f"Successfully saved data to: {output_path}")
         except Exception as e:
-            logging.error(f"Error saving data to CSV: {e}")
+            logging.error(f"Error saving data to parquet: {e}")
             sys.exit(1)
     else:
         logging.info("No data to save.")